@@ -1,8 +1,11 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import os
-from io import StringIO, BytesIO
+import csv
+import sqlite3
+from io import StringIO
+from functools import lru_cache
 
 # ================== CONFIG & DATA ==================
 # Set a unique key for the application session state to ensure stability
@@ -11,18 +14,167 @@ if 'app_key' not in st.session_state:
 
 st.set_page_config(page_title="Continental Snooker", page_icon="🎱", layout="wide")
 
-# Prices per hour
-PRICES = {
-    "English Snooker Table 1": 240,
-    "English Snooker Table 2": 240,
-    "French Snooker Table": 180
+# Tables and their prices per hour, matched by position
+TABLES = (
+    "English Snooker Table 1",
+    "English Snooker Table 2",
+    "French Snooker Table"
+)
+RATES = (240, 240, 180)
+
+# SQLite database holding the booking log
+DB_FILE = "snooker.db"
+_ABS_DB_PATH = os.path.abspath(DB_FILE)
+
+# Bookings used to be kept in this CSV; it is imported once into a fresh database
+LEGACY_CSV_FILE = "snooker_bookings.csv"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings(
+    name TEXT,
+    table_name TEXT,
+    time_range TEXT,
+    price REAL,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_date ON bookings(date);
+"""
+
+# Newest date first; rowid keeps same-day bookings in the order they were entered.
+# Columns are aliased back to the names shown in the UI and the CSV export.
+_SELECT_BOOKINGS = """
+    SELECT name AS Name, table_name AS "Table", time_range AS Time, price AS Price, date AS Date
+    FROM bookings
+    ORDER BY date DESC, rowid
+"""
+
+_INSERT_BOOKING = "INSERT INTO bookings VALUES (?, ?, ?, ?, ?)"
+
+# Fixed dtypes for booking frames, so pandas doesn't infer them on every read.
+# Date stays ISO "%Y-%m-%d" text, which sorts and compares correctly as a string.
+BOOKING_DTYPES = {
+    "Name": "string",
+    "Table": "category",
+    "Time": "string",
+    "Price": "float32",
+    "Date": "string"
 }
 
-# CSV file path (Using CSV eliminates the openpyxl dependency)
-EXCEL_FILE = "snooker_bookings.csv" 
+# Newest bookings shown by default; the full log is only sent to the browser on request
+RECENT_BOOKINGS_LIMIT = 200
+
+# Clean up rows from the old CSV the way pd.read_csv used to read it: blank lines are
+# skipped, short rows are padded and long ones truncated to the 5 booking columns,
+# and a non-numeric Price is stored as 0 so the column stays REAL.
+def _legacy_rows(reader):
+    for row in reader:
+        if not any(field.strip() for field in row):
+            continue
+        row = (row + [""] * 5)[:5]
+        try:
+            row[3] = float(row[3])
+        except ValueError:
+            row[3] = 0.0
+        yield row
+
+# Copy rows from the old CSV log, but only into an empty table so it happens once.
+# BEGIN IMMEDIATE stops two sessions starting at the same time from both importing.
+def import_legacy_csv(conn):
+    if not os.path.exists(LEGACY_CSV_FILE):
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM bookings LIMIT 1").fetchone() is None:
+            with open(LEGACY_CSV_FILE, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                next(reader, None)  # header
+                conn.executemany(_INSERT_BOOKING, _legacy_rows(reader))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# One connection per browser session, reused across reruns via session_state.
+# Reruns may run on different threads, hence check_same_thread=False.
+# WAL lets other sessions keep reading while one saves; concurrent saves are
+# serialized by SQLite's write lock (waiting up to the default 5s timeout).
+def get_connection():
+    if "db_conn" not in st.session_state:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        try:
+            import_legacy_csv(conn)
+        except Exception as e:
+            st.warning(f"Existing CSV file could not be imported. Starting a new log. Error: {e}")
+        st.session_state["db_conn"] = conn
+    return st.session_state["db_conn"]
+
+# Bookings as a DataFrame, newest first; limit=None reads the whole log
+def read_bookings(conn, limit=None):
+    if limit is None:
+        return pd.read_sql_query(_SELECT_BOOKINGS, conn, dtype=BOOKING_DTYPES)
+    return pd.read_sql_query(_SELECT_BOOKINGS + " LIMIT ?", conn, params=(limit,), dtype=BOOKING_DTYPES)
+
+# CSV payload for the download button. The table is append-only, so the row count
+# identifies its contents and a new export is only built after a save. Only the
+# latest export is kept, and a save clears it. Replacing snooker.db with a different
+# file that has the same row count would serve a stale export until the next save;
+# that case is accepted.
+# Rows are streamed from the cursor with the header written once, without a DataFrame.
+@st.cache_data(show_spinner=False, max_entries=1)
+def export_csv(_conn, total_bookings):
+    cursor = _conn.execute(_SELECT_BOOKINGS)
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(column[0] for column in cursor.description)
+    writer.writerows(cursor)
+    return out.getvalue()
+
+try:
+    conn = get_connection()
+except Exception as e:
+    st.error(f"❌ Could not open the booking database '{DB_FILE}'. Error: {e}")
+    st.stop()
+
+# ISO date for today, computed once per rerun (same "%Y-%m-%d" format as the log)
+today_str = date.today().isoformat()
+
+ONE_DAY = timedelta(days=1)
+
+# Parse a single "hh:mm AM/PM" string. Memoized since the same inputs come back on
+# most reruns; invalid strings raise ValueError and are not cached. Streamlit
+# re-executes this script on every rerun, so the lru_cache is held in
+# st.cache_resource to keep it alive between reruns.
+@st.cache_resource(show_spinner=False)
+def _time_parser():
+    @lru_cache(maxsize=64)
+    def parse(s):
+        return datetime.strptime(s.strip().upper(), "%I:%M %p")
+    return parse
+
+_parse_time = _time_parser()
+
+# Parse "hh:mm AM/PM" start/end strings into a duration in hours.
+# Returns (hours, None) on success or (None, error) if either time is invalid.
+# An end time earlier than the start time is treated as crossing midnight.
+def parse_duration_hours(start, end):
+    try:
+        start_dt = _parse_time(start)
+        end_dt = _parse_time(end)
+    except ValueError as e:
+        return None, e
+
+    delta = end_dt - start_dt
+    if delta < timedelta(0):
+        delta += ONE_DAY
+    return delta.total_seconds() / 3600, None
 
 # ================== CUSTOM CSS (LIGHT & GOLD/BLACK THEME) ==================
-st.markdown("""
+# Static markup kept as module-level constants so each rerun just re-injects them
+_CSS = """
     <style>
     /* 1. LIGHT GREY BACKGROUND (Stable) */
     .stApp {
@@ -60,7 +212,8 @@ st.markdown("""
     }
     
     /* 5. Button Styling: Black button with Gold text */
-    .stButton>button {
+    .stButton>button,
+    .stFormSubmitButton>button {
         background-color: #1a1a1a; /* Black button */
         color: #DAA520 !important; /* Gold text */
         border-radius: 12px; 
@@ -68,7 +221,8 @@ st.markdown("""
         border: 2px solid #DAA520; /* Gold border */
         transition: all 0.2s ease;
     }
-    .stButton>button:hover { 
+    .stButton>button:hover,
+    .stFormSubmitButton>button:hover { 
         background-color: #333333; /* Darken on hover */
         color: #ffdf70 !important; /* Lighter gold on hover */
         transform: scale(1.01);
@@ -93,7 +247,21 @@ st.markdown("""
         color: #DAA520 !important;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+_BOX_OPEN = "<div class='custom-box'>"
+_BOX_CLOSE = "</div>"
+
+# File-location footer, kept with the other static markup for readability. Like the
+# rest of the script it is rebuilt on every rerun; that costs next to nothing.
+_FILE_INFO_HTML = f"""
+<div style='font-size: small; color: #555;'>
+    ℹ️ <b>File Location:</b> The booking data is stored in the <b>SQLite database</b> <code>{DB_FILE}</code> located in the same directory as this <code>app.py</code> file:
+    <br/>
+    <code>{_ABS_DB_PATH}</code>
+</div>
+"""
+
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # ================== TITLE & LAYOUT ==================
 
@@ -109,106 +277,88 @@ st.markdown(
 
 st.markdown("---")
 
-col_booking, col_confirm = st.columns(2)
+# The booking inputs live in a form so editing them doesn't rerun the whole script;
+# it only reruns when "Update Estimate" or "Save Booking" is pressed.
+booking_form = st.form("new_booking", border=False)
+col_booking, col_confirm = booking_form.columns(2)
 
 # ================== COLUMN 1: NEW BOOKING ==================
 with col_booking:
-    st.markdown("<div class='custom-box'>", unsafe_allow_html=True) 
+    st.markdown(_BOX_OPEN, unsafe_allow_html=True)
     st.subheader("📝 New Booking")
 
     # Added unique keys to prevent StreamlitDuplicateElementId error
     name = st.text_input("Customer Name", key="customer_name")
-    table = st.selectbox("Choose Table", list(PRICES.keys()), key="selected_table")
+    table_idx = st.selectbox("Choose Table", range(len(TABLES)), format_func=TABLES.__getitem__, key="selected_table_idx")
+    table = TABLES[table_idx]
+    rate = RATES[table_idx]
     start_time = st.text_input("Enter Start Time (hh:mm AM/PM)", "02:00 PM", key="start_time")
     end_time = st.text_input("Enter End Time (hh:mm AM/PM)", "03:00 PM", key="end_time")
     
-    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown(_BOX_CLOSE, unsafe_allow_html=True)
 
 # ================== COLUMN 2: PRICE & CONFIRMATION ==================
 with col_confirm:
-    st.markdown("<div class='custom-box'>", unsafe_allow_html=True) 
+    st.markdown(_BOX_OPEN, unsafe_allow_html=True)
     st.subheader("💲 Price & Confirmation")
     
     current_price_placeholder = st.empty()
     st.markdown("---")
+
+    # Parse the times once per rerun; shared by the save path and the estimate
+    duration_hours, duration_error = parse_duration_hours(start_time, end_time)
+
+    st.form_submit_button("🧮 Update Estimate", use_container_width=True, key="estimate_button")
     
-    if st.button("💾 Save Booking", use_container_width=True, key="save_button"):
+    if st.form_submit_button("💾 Save Booking", use_container_width=True, key="save_button"):
         
         # --- Validation & Calculation ---
         if not name.strip():
             st.error("❌ Customer Name cannot be empty.")
             st.stop()
         
-        try:
-            # Time Parsing
-            start_dt = datetime.strptime(start_time.strip().upper(), "%I:%M %p")
-            end_dt = datetime.strptime(end_time.strip().upper(), "%I:%M %p")
-
-            # Duration/Cross-midnight handling
-            delta = end_dt - start_dt
-            if delta.total_seconds() < 0:
-                 delta += pd.Timedelta(days=1) 
-                 
-            if delta.total_seconds() <= 0:
-                st.error("❌ End time must be after start time.")
-                
-            # Final Calculation and Save
-            else:
-                hours = delta.total_seconds() / 3600
-                price = round(hours * PRICES[table], 2)
-
-                # --- CORE DATA SAVE LOGIC (Using CSV) ---
-                if os.path.exists(EXCEL_FILE):
-                    try:
-                        # READ from CSV
-                        df = pd.read_csv(EXCEL_FILE)
-                    except Exception as e:
-                        st.warning(f"Existing CSV file could not be read. Starting a new log. Error: {e}")
-                        df = pd.DataFrame(columns=["Name", "Table", "Time", "Price", "Date"])
-                else:
-                    df = pd.DataFrame(columns=["Name", "Table", "Time", "Price", "Date"])
-
-                new_row = {
-                    "Name": name.strip(),
-                    "Table": table,
-                    "Time": f"{start_time} - {end_time}",
-                    "Price": price,
-                    "Date": datetime.today().strftime("%Y-%m-%d")
-                }
-                
-                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+        if duration_error is not None:
+            st.error("⚠️ Invalid time format. Please use hh:mm AM/PM (e.g., 02:30 PM).")
+
+        elif duration_hours <= 0:
+            st.error("❌ End time must be after start time.")
                 
-                # WRITE to CSV
-                df.to_csv(EXCEL_FILE, index=False)
+        # Final Calculation and Save
+        else:
+            try:
+                hours = duration_hours
+                price = round(hours * rate, 2)
+
+                # --- CORE DATA SAVE LOGIC (Using SQLite) ---
+                with conn:
+                    conn.execute(_INSERT_BOOKING, (
+                        name.strip(),
+                        table,
+                        f"{start_time} - {end_time}",
+                        price,
+                        today_str
+                    ))
+                export_csv.clear()
                 # --- END CORE DATA SAVE LOGIC ---
 
-                st.success(f"✅ Booking saved! Total Price: ₹{price:,.2f} for {round(hours, 2)} hours. Data saved to '{EXCEL_FILE}'.")
+                st.success(f"✅ Booking saved! Total Price: ₹{price:,.2f} for {round(hours, 2)} hours. Data saved to '{DB_FILE}'.")
                 st.balloons() 
 
-        except ValueError: 
-            st.error("⚠️ Invalid time format. Please use hh:mm AM/PM (e.g., 02:30 PM).")
-        except Exception as e:
-             st.error(f"⚠️ An unexpected error occurred: {e}")
+            except Exception as e:
+                st.error(f"⚠️ An unexpected error occurred: {e}")
 
-    # Calculate and display current price estimate dynamically
-    try:
-        # Using session state for accurate dynamic calculation
-        start_dt_calc = datetime.strptime(st.session_state.start_time.strip().upper(), "%I:%M %p")
-        end_dt_calc = datetime.strptime(st.session_state.end_time.strip().upper(), "%I:%M %p")
+    # Calculate and display the price estimate for the submitted inputs.
+    # parse_duration_hours returns any parse error instead of raising it, so it is checked here directly.
+    if duration_error is None:
+        hours_calc = duration_hours
+        price_calc = round(hours_calc * rate, 2)
         
-        delta_calc = end_dt_calc - start_dt_calc
-        if delta_calc.total_seconds() < 0:
-            delta_calc += pd.Timedelta(days=1)
-            
-        hours_calc = delta_calc.total_seconds() / 3600
-        price_calc = round(hours_calc * PRICES[st.session_state.selected_table], 2)
+        current_price_placeholder.info(f"Hourly Rate: **₹{rate}** | Est. Price: **₹{price_calc:,.2f}** for {round(hours_calc, 2)} hours")
         
-        current_price_placeholder.info(f"Hourly Rate: **₹{PRICES[st.session_state.selected_table]}** | Est. Price: **₹{price_calc:,.2f}** for {round(hours_calc, 2)} hours")
-        
-    except:
-        current_price_placeholder.info(f"Hourly Rate: **₹{PRICES[table]}** | Enter valid times for estimate.")
+    else:
+        current_price_placeholder.info(f"Hourly Rate: **₹{rate}** | Enter valid times for estimate.")
         
-    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown(_BOX_CLOSE, unsafe_allow_html=True)
 
 st.markdown("---") 
 
@@ -217,65 +367,63 @@ st.markdown("---")
 col_stats, col_bookings = st.columns([1, 2]) 
 
 with col_stats:
-    st.markdown("<div class='custom-box'>", unsafe_allow_html=True) 
+    st.markdown(_BOX_OPEN, unsafe_allow_html=True)
     st.subheader("📊 Quick Stats")
 
-    if os.path.exists(EXCEL_FILE):
-        try:
-            # READ from CSV for stats
-            df = pd.read_csv(EXCEL_FILE)
-            df['Price'] = pd.to_numeric(df['Price'], errors='coerce').fillna(0) 
-            
-            total_bookings = len(df)
-            total_revenue = df["Price"].sum()
-            today_revenue = df[df["Date"] == datetime.today().strftime("%Y-%m-%d")]["Price"].sum()
+    try:
+        # Both revenue figures come from one aggregate query; nothing is loaded into pandas
+        total_bookings, total_revenue, today_revenue = conn.execute(
+            "SELECT COUNT(*), TOTAL(price), TOTAL(CASE WHEN date = ? THEN price END) FROM bookings",
+            (today_str,)
+        ).fetchone()
+    except Exception as e:
+        st.error(f"Error reading stats from the database: {e}")
+        total_bookings = None
 
+    if total_bookings:
+        try:
             st.metric("Total Bookings", total_bookings)
             st.metric("Total Revenue", f"₹{total_revenue:,.2f}")
             st.metric("Today's Revenue", f"₹{today_revenue:,.2f}")
 
-            # Download button (Using CSV format for download)
-            towrite = StringIO()
-            df.to_csv(towrite, index=False)
-            towrite.seek(0)
-            
+            # Download button (CSV export, rebuilt only when the bookings change)
             st.download_button(
                 label="📥 Download CSV",
-                data=towrite.getvalue(),
+                data=export_csv(conn, total_bookings),
                 file_name="snooker_bookings.csv",
                 mime="text/csv", # Changed MIME type
                 use_container_width=True,
                 key="download_button"
             )
         except Exception as e:
-            st.error(f"Error reading stats from CSV: {e}")
-    else:
+            st.error(f"Error exporting bookings to CSV: {e}")
+    elif total_bookings == 0:
         st.info("No bookings yet.")
 
-    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown(_BOX_CLOSE, unsafe_allow_html=True)
 
 with col_bookings:
-    st.markdown("<div class='custom-box'>", unsafe_allow_html=True) 
+    st.markdown(_BOX_OPEN, unsafe_allow_html=True)
     st.subheader("📋 All Saved Bookings")
     
-    if os.path.exists(EXCEL_FILE):
+    if total_bookings:
         try:
-            # READ from CSV for display
-            df_all = pd.read_csv(EXCEL_FILE)
-            st.dataframe(df_all.sort_values(by="Date", ascending=False).reset_index(drop=True), use_container_width=True)
+            show_all = False
+            if total_bookings > RECENT_BOOKINGS_LIMIT:
+                st.caption(f"Showing the newest {RECENT_BOOKINGS_LIMIT} of {total_bookings} bookings.")
+                show_all = st.checkbox("Show all bookings", key="show_all_bookings")
+
+            # READ the newest bookings only unless asked. The index on date covers the date part
+            # of the ORDER BY; SQLite still sorts same-day rows by rowid in a temp B-tree.
+            df_all = read_bookings(conn, None if show_all else RECENT_BOOKINGS_LIMIT)
+            st.dataframe(df_all, use_container_width=True)
         except Exception as e:
-            st.error(f"Error displaying bookings from CSV: {e}")
-    else:
+            st.error(f"Error displaying bookings from the database: {e}")
+    elif total_bookings == 0:
         st.info("No bookings saved yet.")
         
-    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown(_BOX_CLOSE, unsafe_allow_html=True)
 
 # ================== FILE LOCATION DISPLAY ==================
 st.markdown("---")
-st.markdown(f"""
-<div style='font-size: small; color: #555;'>
-    ℹ️ **File Location:** The booking data is stored in the **CSV file** `{EXCEL_FILE}` located in the same directory as this `app.py` file:
-    <br/>
-    <code>{os.path.abspath(EXCEL_FILE)}</code>
-</div>
-""", unsafe_allow_html=True)
+st.markdown(_FILE_INFO_HTML, unsafe_allow_html=True)